@@ -1,24 +1,58 @@
 import os
 import sys
-import glob
 import json
 import datetime
 import io
+import functools
+import collections
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import freeze_support
 import pydicom
 from pydicom.errors import InvalidDicomError
-from pydicom.tag import Tag
+from pydicom.multival import MultiValue
+from pydicom.sequence import Sequence
+from pydicom.tag import BaseTag, Tag
 
-PIXEL_DATA_TAG = Tag((0x7fe0, 0x0010))
+try:
+    import orjson # Optional, much faster JSON encoding
+except ImportError:
+    orjson = None
+
+_PIXEL_DATA_INT = 0x7FE00010 # (7FE0,0010) Pixel Data, compared as a plain int
+_BINARY_VRS = frozenset(('OB', 'OW', 'UN'))
+_RAW_BYTES_VRS = frozenset(('OB', 'OW')) # Raw values of these VRs need no conversion
+_DICOM_EXTENSIONS = ('.dcm', '.DCM') # Files without an extension are also considered
+CHUNK_SIZE = 16 # Files per process pool task
+LOG_EVERY = 256 # Progress is logged once per this many files
+MAX_BYTES_LENGTH = 1024 # Longer bytes values are replaced with a placeholder in the output
+
+# Flat tag -> keyword map of the standard DICOM dictionary, built once at import
+_TAG_KW = {int(tag): entry[4] for tag, entry in pydicom.datadict.DicomDictionary.items()}
+
+@functools.lru_cache(maxsize=None)
+def _kw_for_tag(tag_int):
+    """Cached keyword lookup for a tag given as an int (the DICOM dictionary is static)."""
+    keyword = pydicom.datadict.keyword_for_tag(tag_int)
+    if keyword:
+        return keyword
+    return "Private Tag" if Tag(tag_int).is_private else "Unknown Standard Tag"
 
 def gather_dicom_metadata(filepath):
     """
     Gathers all metadata (except pixel data) from a single DICOM file using only pydicom.
     Returns a list of dictionaries, each representing a metadata entry.
     """
-    metadata_entries = []
-
+    # Files without an extension (README, LICENSE, ...) are only read if they
+    # carry the DICOM preamble and 'DICM' marker, i.e. without force=True
+    force = '.' in os.path.basename(filepath)
     try:
-        ds = pydicom.dcmread(filepath, force=True)
+        # Stop parsing at the pixel data so it is never read into memory
+        ds = pydicom.dcmread(filepath, force=force, stop_before_pixels=True)
+        # Iterate the unconverted (raw) elements, see _make_entry. Conversion can
+        # fail on non-DICOM files read with force=True, so it stays in the try.
+        # The pixel data check is defensive, dcmread stops before pixel data.
+        return [_make_entry(ds, elem) for elem in ds.elements() if int(elem.tag) != _PIXEL_DATA_INT]
     except InvalidDicomError:
         print(f"--- Skipping: {os.path.basename(filepath)} (Not a valid DICOM file or corrupted) ---", file=sys.stderr)
         return None
@@ -26,123 +60,169 @@ def gather_dicom_metadata(filepath):
         print(f"--- Error processing {os.path.basename(filepath)}: {e} ---", file=sys.stderr)
         return None
 
-    for elem in ds:
-        if elem.tag == PIXEL_DATA_TAG:
-            continue
-
-        keyword = elem.keyword if elem.keyword else pydicom.datadict.keyword_for_tag(elem.tag)
-        if not keyword:
-            if elem.tag.is_private:
-                keyword = "Private Tag"
-            else:
-                keyword = "Unknown Standard Tag"
+def _make_entry(ds, elem):
+    """Builds the metadata entry for a (possibly raw) top-level element of ds."""
+    tag_int = int(elem.tag)
+    keyword = _TAG_KW.get(tag_int) or _kw_for_tag(tag_int) # Repeater/private tags fall back
 
+    value_to_store = elem.value
+    if not (isinstance(value_to_store, bytes) and elem.VR in _RAW_BYTES_VRS):
+        # Convert to a DataElement only when the typed value is needed.
+        # Raw OB/OW values are already the bytes conversion would return.
+        elem = ds[elem.tag]
         value_to_store = elem.value
 
-        if isinstance(value_to_store, bytes) and elem.VR in ['OB', 'OW', 'UN']:
-            if len(value_to_store) > 1024 * 1024: # Example: if > 1MB, store a summary
-                value_to_store = f"<Binary Data, length: {len(value_to_store)} bytes, first 16 hex: {value_to_store[:16].hex()}...>"
+    if isinstance(value_to_store, bytes) and elem.VR in _BINARY_VRS:
+        if len(value_to_store) > 1024 * 1024: # Example: if > 1MB, store a summary
+            value_to_store = f"<Binary Data, length: {len(value_to_store)} bytes, first 16 hex: {value_to_store[:16].hex()}...>"
+    elif isinstance(value_to_store, BaseTag):
+        # Tags are ints, which the JSON encoders would write as numbers
+        value_to_store = str(value_to_store)
+
+    return {
+        "tag": tag_int,
+        "keyword": keyword,
+        "value": value_to_store
+    }
+
+def _serialize_bytes(obj):
+    if len(obj) > MAX_BYTES_LENGTH:
+        return f"<Binary data, {len(obj)} bytes, removed>"
+    if obj.isascii(): # Fast path: ASCII always decodes, no exception handling needed
+        return obj.decode('ascii')
+    try:
+        return obj.decode('utf-8')
+    except UnicodeDecodeError:
+        return f"<Binary data, {len(obj)} bytes, not UTF-8 decodable>"
+
+def _serialize_multivalue(obj):
+    # Tags are ints the encoders would write as numbers; match single AT values
+    return [str(item) if isinstance(item, BaseTag) else item for item in obj]
 
-        entry = {
-            "tag": elem.tag,
-            "keyword": keyword,
-            "value": value_to_store
-        }
-        metadata_entries.append(entry)
+def _serialize_sequence(obj):
+    return f"<Sequence, length {len(obj)}>"
 
-    return metadata_entries
+_SERIALIZERS = {
+    bytes: _serialize_bytes,
+    Sequence: _serialize_sequence,
+    MultiValue: _serialize_multivalue,
+}
 
-def serialize_dicom_metadata(data, max_bytes_length=1024):
+def _json_default(obj):
     """
-    Safely serializes DICOM metadata to a JSON-compatible dictionary.
+    Converts a value the JSON encoder cannot encode natively. Used as the default
+    hook of both orjson and DicomEncoder, so metadata is encoded in a single pass.
+    """
+    # Dispatch on the exact type, falling back to the generic conversions
+    handler = _SERIALIZERS.get(type(obj))
+    if handler is not None:
+        return handler(obj)
+    if isinstance(obj, float):
+        # orjson does not encode float subclasses such as pydicom's DSfloat
+        return float(obj)
+    return str(obj)
 
-    Args:
-        data (dict): The input dictionary with DICOM metadata.
-        max_bytes_length (int): The maximum length for byte values.
-                                If a byte value exceeds this, it will be replaced
-                                with a placeholder string.
+class DicomEncoder(json.JSONEncoder):
+    """JSON encoder for DICOM metadata values (bytes, Sequence, MultiValue, ...)."""
+    def default(self, o):
+        return _json_default(o)
 
-    Returns:
-        dict: A new dictionary with values converted to JSON-friendly formats.
+def dump_json_bytes(obj):
     """
-    processed_data = {}
-    for path, meta_list in data.items():
-        processed_meta_list = []
-        for item in meta_list:
-            processed_item = item.copy()  # Create a copy to avoid modifying original data
-            value = processed_item.get('value')
-
-            if isinstance(value, bytes):
-                if len(value) > max_bytes_length:
-                    processed_item['value'] = f"<Binary data, {len(value)} bytes, removed>"
-                else:
-                    try:
-                        processed_item['value'] = value.decode('utf-8')
-                    except UnicodeDecodeError:
-                        processed_item['value'] = f"<Binary data, {len(value)} bytes, not UTF-8 decodable>"
-            elif hasattr(value, '__class__') and value.__class__.__name__ == 'Sequence':
-                # Handle pydicom.Sequence objects
-                processed_item['value'] = f"<Sequence, length {len(value)}>"
-            elif hasattr(value, '__class__') and value.__class__.__name__ == 'MultiValue':
-                # Convert pydicom.multival.MultiValue to a list
-                processed_item['value'] = list(value)
-            elif hasattr(value, '__class__') and value.__class__.__name__ == 'Tag':
-                # Convert pydicom.tag.Tag to a string representation
-                processed_item['value'] = str(value)
-            elif isinstance(value, (list, dict)):
-                # Ensure nested lists and dictionaries are handled recursively
-                processed_item['value'] = _recursive_serialize(value, max_bytes_length)
-            else:
-                try:
-                    # Attempt to convert other types to string if they are not directly JSON serializable
-                    json.dumps(value)
-                except TypeError:
-                    processed_item['value'] = str(value)
-            
-            # Convert tuple tags to string representation (e.g., (0008, 0005) -> "(0008, 0005)")
-            if 'tag' in processed_item and isinstance(processed_item['tag'], tuple):
-                processed_item['tag'] = str(processed_item['tag'])
-
-            processed_meta_list.append(processed_item)
-        processed_data[path] = processed_meta_list
-    return processed_data
-
-def _recursive_serialize(obj, max_bytes_length):
-    """Helper function for recursive serialization."""
-    if isinstance(obj, dict):
-        return {k: _recursive_serialize(v, max_bytes_length) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [_recursive_serialize(elem, max_bytes_length) for elem in obj]
-    elif isinstance(obj, bytes):
-        if len(obj) > max_bytes_length:
-            return f"<Binary data, {len(obj)} bytes, removed>"
-        else:
-            try:
-                return obj.decode('utf-8')
-            except UnicodeDecodeError:
-                return f"<Binary data, {len(obj)} bytes, not UTF-8 decodable>"
-    elif hasattr(obj, '__class__') and obj.__class__.__name__ == 'Sequence':
-        return f"<Sequence, length {len(obj)}>"
-    elif hasattr(obj, '__class__') and obj.__class__.__name__ == 'MultiValue':
-        return list(obj)
-    elif hasattr(obj, '__class__') and obj.__class__.__name__ == 'Tag':
-        return str(obj)
-    else:
+    Encodes an object to UTF-8 JSON bytes indented by 2 spaces, using orjson if available.
+    Both encoders produce equivalent JSON, though not byte-identical: orjson writes
+    e.g. 1e-6 where json writes 1e-06, and NaN as null.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, cls=DicomEncoder, indent=2, ensure_ascii=False).encode('utf-8')
+
+def process_dicom_file(filepath):
+    """
+    Process pool worker: gathers the metadata of a single DICOM file and encodes it
+    to JSON, so only bytes (not pydicom objects) are sent back to the main process.
+    Returns a (number of metadata fields, JSON bytes) tuple, or None if the file
+    has no metadata.
+    """
+    metadata = gather_dicom_metadata(filepath)
+    if metadata is None:
+        return None
+    try:
+        return len(metadata), dump_json_bytes(metadata)
+    except (TypeError, ValueError) as e:
+        print(f"--- Error encoding {os.path.basename(filepath)}: {e} ---", file=sys.stderr)
+        return None
+
+def process_dicom_files(filepaths):
+    """Process pool worker for a chunk of files, see process_dicom_file."""
+    return [process_dicom_file(filepath) for filepath in filepaths]
+
+def iter_processed_files(executor, filepaths, max_workers):
+    """
+    Yields (filepath, process_dicom_file result) for all files, in input order.
+    At most 2 * max_workers chunks are in flight, and a new chunk is only
+    submitted once the oldest one is consumed. A slow file therefore cannot let
+    finished results pile up in memory.
+    """
+    chunks = (filepaths[i:i + CHUNK_SIZE] for i in range(0, len(filepaths), CHUNK_SIZE))
+    pending = collections.deque()
+    for chunk in itertools.islice(chunks, 2 * max_workers):
+        pending.append((chunk, executor.submit(process_dicom_files, chunk)))
+    while pending:
+        chunk, future = pending.popleft()
+        chunk_results = future.result()
+        next_chunk = next(chunks, None)
+        if next_chunk is not None:
+            pending.append((next_chunk, executor.submit(process_dicom_files, next_chunk)))
+        yield from zip(chunk, chunk_results)
+
+def find_dicom_files(directory):
+    """
+    Yields paths of potential DICOM files (.dcm, .DCM or no extension) under the
+    given directory and its subdirectories, walking the tree in a single pass.
+    Symlinked directories are followed, as with glob; each directory is visited
+    once, which also guards against symlink cycles. Hidden entries and
+    unreadable directories are skipped.
+    """
+    # Iterative walk: paths are yielded directly instead of through one nested
+    # generator per directory level. DirEntry.path is already joined.
+    pending_dirs = [directory]
+    visited_dirs = set()
+    while pending_dirs:
+        dir_path = pending_dirs.pop()
         try:
-            json.dumps(obj) # Test if it's serializable
-            return obj
-        except TypeError:
-            return str(obj)
+            # os.stat rather than DirEntry.stat, which has no inode on Windows
+            st = os.stat(dir_path)
+            dir_id = (st.st_dev, st.st_ino)
+            if dir_id in visited_dirs:
+                continue
+            visited_dirs.add(dir_id)
+            it = os.scandir(dir_path)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                name = entry.name
+                if name.startswith('.'):
+                    continue
+                if entry.is_dir():
+                    pending_dirs.append(entry.path)
+                elif entry.is_file():
+                    if name.endswith(_DICOM_EXTENSIONS) or '.' not in name:
+                        yield entry.path
 
 def main():
     # Determine the base directory (where the script/executable is located)
     if getattr(sys, 'frozen', False):
         # Running as a PyInstaller bundle
         base_directory = os.path.dirname(sys.executable)
+        # On Linux/macOS the executable has no extension; never parse it as DICOM
+        own_executable = os.path.abspath(sys.executable)
         print(f"Running as an executable. Base directory: {base_directory}")
     else:
         # Running as a normal Python script
         base_directory = os.path.dirname(os.path.abspath(__file__))
+        own_executable = None
         print(f"Running as a script. Base directory: {base_directory}")
 
     # Define output file paths
@@ -162,12 +242,7 @@ def main():
         print(f"Logs will be saved to: {log_output_file}")
         print("-" * 50)
 
-        all_dicom_files = []
-        for ext in ['dcm', 'DCM', '']: # Common DICOM extensions or no extension
-            search_pattern = os.path.join(base_directory, f"**/*.{ext}")
-            all_dicom_files.extend(glob.glob(search_pattern, recursive=True))
-
-        all_dicom_files = sorted(list(set(all_dicom_files)))
+        all_dicom_files = sorted(path for path in find_dicom_files(base_directory) if path != own_executable)
 
         if not all_dicom_files:
             print(f"No potential DICOM files found in '{base_directory}' or its subdirectories.")
@@ -177,29 +252,53 @@ def main():
         print(f"Found {len(all_dicom_files)} potential DICOM files. Processing...")
         print("-" * 50)
 
-        collected_metadata = {} # Dictionary to store metadata, keys are file paths
-
-        for i, filepath in enumerate(all_dicom_files):
-            print_str = f"[{i+1}/{len(all_dicom_files)}] Processed file: {os.path.basename(filepath)}"
-            metadata = gather_dicom_metadata(filepath)
-            if metadata is not None:
-                collected_metadata[filepath] = metadata
-                print_str += f" -- {len(metadata)} meta fields"
-            else:
-                print_str += " -- No metadata"
-            print(print_str)
-
-        print("-" * 50)
-        print(f"Finished processing {len(collected_metadata)} valid DICOM files.")
-        
-        json_processed_data = serialize_dicom_metadata(collected_metadata, max_bytes_length=1024)
-        
+        # Metadata is streamed to a temporary file as results arrive, and only a
+        # bounded number of chunks is in flight, so memory use does not grow with
+        # the number of files. The output file is only
+        # replaced once the JSON is complete, so a failed run never leaves
+        # truncated JSON behind or destroys earlier output.
+        temp_filepath = output_filepath + ".tmp"
+        num_valid_files = 0
         try:
-            with open(output_filepath, 'w', encoding='utf-8') as f:
-                json.dump(json_processed_data, f, indent=2, ensure_ascii=False)
-            print(f"Successfully saved all metadata to: {output_filepath}")
-        except Exception as e:
+            with open(temp_filepath, 'wb') as output_file:
+                output_file.write(b"{")
+                # Each file is parsed and encoded independently, so spread the work across
+                # processes. Results come back in input order; chunks of CHUNK_SIZE files
+                # amortize the IPC overhead.
+                max_workers = os.cpu_count() or 1
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    results = iter_processed_files(executor, all_dicom_files, max_workers)
+                    total = len(all_dicom_files)
+                    last = total - 1
+                    for i, (filepath, result) in enumerate(results):
+                        if result is not None:
+                            num_fields, entry_bytes = result
+                            # Same layout as json.dump(..., indent=2) of the whole dictionary
+                            entry_bytes = entry_bytes.replace(b"\n", b"\n  ")
+                            output_file.write(b"," if num_valid_files else b"")
+                            output_file.write(b"\n  " + dump_json_bytes(filepath) + b": " + entry_bytes)
+                            num_valid_files += 1
+                            # Log progress every LOG_EVERY files and for the last file
+                            if i % LOG_EVERY == 0 or i == last:
+                                print(f"[{i+1}/{total}] Processed file: {os.path.basename(filepath)} -- {num_fields} meta fields")
+                        else:
+                            # Files without metadata are always logged
+                            print(f"[{i+1}/{total}] Processed file: {os.path.basename(filepath)} -- No metadata")
+                output_file.write(b"\n}" if num_valid_files else b"}")
+            os.replace(temp_filepath, output_filepath)
+        except (OSError, TypeError, ValueError) as e: # I/O and JSON encoding errors
             print(f"Error saving metadata: {e}")
+        else:
+            print("-" * 50)
+            print(f"Finished processing {num_valid_files} valid DICOM files.")
+            print(f"Successfully saved all metadata to: {output_filepath}")
+        finally:
+            # Only left behind if the run failed
+            if os.path.exists(temp_filepath):
+                try:
+                    os.remove(temp_filepath)
+                except OSError:
+                    pass
 
         print("\n--- DICOM processing complete ---")
 
@@ -212,4 +311,5 @@ def main():
         print(f"Process finished. Check '{log_output_file}' for full logs and '{output_filepath}' for metadata.")
 
 if __name__ == "__main__":
+    freeze_support() # Required for the process pool in PyInstaller bundles
     main()